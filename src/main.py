@@ -3,23 +3,49 @@ LLM-Based Ticket Reply Evaluator
 Rauda AI — Take-Home Assignment
 
 Uso:
-    python src/main.py
+    python src/main.py [--input RUTA] [--format {csv,parquet}] [--batch] [--workers N]
 
-Lee tickets.csv, evalúa cada par (ticket, reply) con Llama 3.3 70B vía Groq
-y guarda los resultados en tickets_evaluated.csv.
+Lee tickets.csv (o el CSV/Parquet indicado con --input), evalúa cada par (ticket, reply) con Llama 3.3 70B vía Groq
+y guarda los resultados en tickets_evaluated.parquet (o .csv con --format csv).
 """
 
 import os
-import json
+import glob
+import uuid
+import shutil
+import tempfile
+import time
+import asyncio
+import itertools
+import hashlib
+import argparse
 import logging
+import multiprocessing
+from types import MappingProxyType
+from typing import NamedTuple
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+import httpx
+import orjson
+import diskcache
+import numpy as np
 import pandas as pd
-
-from groq import Groq
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from groq import (
+    AsyncGroq,
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
+)
+from aiolimiter import AsyncLimiter
+from pydantic import BaseModel, Field, ValidationError
 from dotenv import load_dotenv
 from tenacity import (
     retry,
     stop_after_attempt,
-    wait_exponential,
     retry_if_exception_type,
 )
 
@@ -42,11 +68,20 @@ if not GROQ_API_KEY:
 
 MODEL       = "llama-3.3-70b-versatile"
 TEMPERATURE = 0.1
-MAX_RETRIES = 4
+MAX_RETRIES = 3     # Intentos por completion (red, 429, 5xx), todos pasan por el limitador
+API_MAX_RETRIES = 5 # Reintentos internos del SDK, solo para las llamadas de la Batch API
+RETRY_AFTER_MAX = 30.0  # Espera máxima (s) que se respeta de un Retry-After
+MAX_CONCURRENCY = 20
+GROQ_RPM    = 30    # Peticiones por minuto permitidas por el plan de Groq
 INPUT_FILE  = "data/tickets.csv"
-OUTPUT_FILE = "data/tickets_evaluated.csv"
+OUTPUT_FILE = "data/tickets_evaluated.parquet"
+CHECKPOINT_DIR = "data/tickets_evaluated.checkpoint"
+CHUNK       = 128   # Evaluaciones acumuladas antes de volcarlas al checkpoint
+BATCH_MIN_ROWS     = 50    # Por debajo, la Batch API no compensa su latencia
+BATCH_POLL_SECONDS = 30
+CACHE_DIR   = os.getenv("GROQ_CACHE_DIR", ".groq_cache")
 
-client = Groq(api_key=GROQ_API_KEY)
+cache = diskcache.Cache(CACHE_DIR)
 
 # ── Prompt ─────────────────────────────────────────────────────────────────────
 
@@ -86,34 +121,204 @@ CRITICAL INSTRUCTIONS:
   "format_explanation": "<one or two sentences>"
 }
 """
+# Texto fijo y byte a byte idéntico en cada llamada: así el prefijo de la
+# conversación es cacheable por el proveedor (prompt caching automático de Groq).
+SYSTEM_PROMPT = SYSTEM_PROMPT.strip()
+
+# Partes constantes de cada petición, construidas una sola vez e inmutables.
+_SYSTEM_MSG     = MappingProxyType({"role": "system", "content": SYSTEM_PROMPT})
+RESPONSE_FORMAT = MappingProxyType({"type": "json_object"})
 
 
 def build_user_prompt(ticket: str, reply: str) -> str:
     """
     Serializa ticket y reply como JSON para enviarlos al modelo.
-    Usar json.dumps() garantiza el escape correcto de caracteres especiales.
+    orjson garantiza el escape correcto de caracteres especiales, emite UTF-8
+    sin escapar y sin espacios entre separadores (menos tokens).
+    """
+    return orjson.dumps({"ticket": ticket, "reply": reply}).decode()
+
+
+def build_request_body(ticket: str, reply: str) -> dict:
     """
-    return json.dumps({"ticket": ticket, "reply": reply}, ensure_ascii=False)
+    Parámetros de la petición de chat completion para un par (ticket, reply).
+    Se comparte entre la llamada directa y las líneas de la Batch API.
+    """
+    return {
+        "model": MODEL,
+        "temperature": TEMPERATURE,
+        "response_format": RESPONSE_FORMAT,
+        "messages": [
+            _SYSTEM_MSG,
+            {"role": "user", "content": build_user_prompt(ticket, reply)},
+        ],
+    }
+
+
+class Evaluation(BaseModel):
+    """
+    Schema de la respuesta del modelo. pydantic-core compila el validador
+    (en Rust) una sola vez y parsea el JSON directamente, sin json.loads.
+    Los scores son estrictos: "5" o 5.0 no se aceptan como enteros.
+    """
+    model_config = {"extra": "ignore"}
+
+    content_score:       int = Field(strict=True, ge=1, le=5)
+    content_explanation: str
+    format_score:        int = Field(strict=True, ge=1, le=5)
+    format_explanation:  str
+
+
+def parse_evaluation(content: str) -> dict:
+    """
+    Parsea la respuesta del modelo y valida el schema de evaluación.
+
+    Args:
+        content: Texto JSON devuelto por el modelo.
+
+    Returns:
+        Dict con content_score, content_explanation, format_score, format_explanation.
+
+    Raises:
+        ValueError: Si la respuesta no cumple el schema esperado. El mensaje
+            resume los errores de validación en una sola línea, apta para
+            guardarse como explicación en la salida.
+    """
+    try:
+        return Evaluation.model_validate_json(content).model_dump()
+    except ValidationError as e:
+        summary = "; ".join(
+            f"{'.'.join(map(str, err['loc'])) or 'json'}: {err['msg']}" for err in e.errors()
+        )
+        raise ValueError(f"Respuesta inválida del modelo: {summary}") from None
+
+
+# ── Caché de respuestas ────────────────────────────────────────────────────────
+
+def cache_key(ticket: str, reply: str) -> str:
+    """
+    Clave de caché de una evaluación. La respuesta depende solo del modelo,
+    la temperatura, el system prompt y el par (ticket, reply). Se hashea una
+    lista JSON (no un texto concatenado) para que ("a|b", "c") y ("a", "b|c")
+    no colisionen.
+    """
+    raw = orjson.dumps([MODEL, TEMPERATURE, SYSTEM_PROMPT, ticket, reply])
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
 
 
 # ── Llamada a la API con reintentos ────────────────────────────────────────────
 
+class GroqSession(NamedTuple):
+    """
+    Clientes y limitador de tasa que comparten las llamadas de una ejecución.
+    `completions` es el mismo cliente sin reintentos internos: los reintentos
+    de cada completion los gestiona _request_completion para que todos
+    pasen por el limitador.
+    """
+    client:      AsyncGroq
+    completions: AsyncGroq
+    limiter:     AsyncLimiter
+
+
+@asynccontextmanager
+async def groq_session(rpm: float = GROQ_RPM, transport: httpx.AsyncBaseTransport | None = None):
+    """
+    Crea, dentro del bucle asyncio en curso, el cliente AsyncGroq y el
+    limitador de tasa que usan las llamadas a la API, y los entrega como
+    GroqSession para pasarlos explícitamente a quien los necesite.
+
+    Todas las peticiones comparten un httpx.AsyncClient con HTTP/2 y
+    keep-alive, de modo que las conexiones TLS se reutilizan en lugar de
+    negociarse en cada llamada. El cliente HTTP se cierra siempre al salir.
+
+    Args:
+        rpm:       Peticiones por minuto permitidas en esta sesión.
+        transport: Transporte httpx alternativo (p. ej. httpx.MockTransport en tests).
+    """
+    http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=MAX_CONCURRENCY * 2,
+            max_keepalive_connections=MAX_CONCURRENCY,
+        ),
+        transport=transport,
+    )
+    client = AsyncGroq(
+        api_key=GROQ_API_KEY,
+        max_retries=API_MAX_RETRIES,
+        timeout=httpx.Timeout(30.0, connect=5.0),
+        http_client=http_client,
+    )
+    try:
+        yield GroqSession(
+            client=client,
+            completions=client.with_options(max_retries=0),
+            limiter=AsyncLimiter(max_rate=rpm, time_period=60),
+        )
+    finally:
+        await http_client.aclose()
+
+
+async def run_evaluation(evaluate, df: pd.DataFrame, *args, rpm: float = GROQ_RPM) -> pd.DataFrame:
+    """Ejecuta `evaluate(session, df, *args)` dentro de una groq_session()."""
+    async with groq_session(rpm) as session:
+        return await evaluate(session, df, *args)
+
+
+def _retry_wait(retry_state) -> float:
+    """
+    Espera entre intentos: lo que indique Retry-After en un 429 (acotado a
+    RETRY_AFTER_MAX) y 0.5s fijos en el resto de casos.
+    """
+    error = retry_state.outcome.exception()
+    if isinstance(error, RateLimitError):
+        try:
+            return min(float(error.response.headers.get("retry-after", "")), RETRY_AFTER_MAX)
+        except ValueError:
+            pass
+    return 0.5
+
+
 @retry(
-    retry=retry_if_exception_type(Exception),
+    retry=retry_if_exception_type(
+        (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+    ),
     stop=stop_after_attempt(MAX_RETRIES),
-    wait=wait_exponential(multiplier=1, min=2, max=60),
+    wait=_retry_wait,
+    reraise=True,
     before_sleep=lambda retry_state: logger.warning(
         f"  ⚠️ Reintento {retry_state.attempt_number}/{MAX_RETRIES} "
         f"tras error: {retry_state.outcome.exception()}"
     ),
 )
-def call_llm_api(ticket: str, reply: str) -> dict:
+async def _request_completion(session: GroqSession, ticket: str, reply: str) -> str:
+    """
+    Hace la petición de chat completion y devuelve el texto de la respuesta.
+
+    El cliente de completions tiene max_retries=0, así que cada intento HTTP
+    es un intento de tenacity y consume un token del limitador: como mucho
+    MAX_RETRIES peticiones por fila, nunca fuera del presupuesto de RPM.
+    """
+    async with session.limiter:
+        response = await session.completions.chat.completions.create(**build_request_body(ticket, reply))
+    return response.choices[0].message.content
+
+
+async def call_llm_api(session: GroqSession, ticket: str, reply: str) -> dict:
     """
     Llama al LLM y devuelve un dict con los 4 campos de evaluación.
+    El limitador de tasa reparte las peticiones dentro del presupuesto de
+    GROQ_RPM, así que los 429 se evitan en lugar de esperarse con backoff.
+    Las evaluaciones válidas se guardan en caché en disco, de modo que volver
+    a ejecutar sobre los mismos pares no vuelve a llamar a la API.
+
+    Una respuesta que no cumple el schema no se reintenta: la fila se marca
+    como error directamente.
 
     Args:
-        ticket: Mensaje original del cliente.
-        reply:  Respuesta del sistema de IA a evaluar.
+        session: Sesión abierta con groq_session().
+        ticket:  Mensaje original del cliente.
+        reply:   Respuesta del sistema de IA a evaluar.
 
     Returns:
         Dict con content_score, content_explanation, format_score, format_explanation.
@@ -121,92 +326,496 @@ def call_llm_api(ticket: str, reply: str) -> dict:
     Raises:
         ValueError: Si la respuesta no cumple el schema esperado.
     """
-    response = client.chat.completions.create(
-        model=MODEL,
-        temperature=TEMPERATURE,
-        response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user",   "content": build_user_prompt(ticket, reply)},
-        ],
+    key = cache_key(ticket, reply)
+    cached = await asyncio.to_thread(cache.get, key)
+    if cached is not None:
+        return cached
+
+    result = parse_evaluation(await _request_completion(session, ticket, reply))
+    await asyncio.to_thread(cache.set, key, result)
+    return result
+
+
+# ── Evaluación del DataFrame ───────────────────────────────────────────────────
+
+# Cada evaluación se guarda con su cache_key, que incluye MODEL, TEMPERATURE
+# y SYSTEM_PROMPT: si cambia la configuración, el checkpoint deja de coincidir.
+CHECKPOINT_SCHEMA = pa.schema([
+    ("key",                 pa.string()),
+    ("content_score",       pa.int8()),
+    ("content_explanation", pa.string()),
+    ("format_score",        pa.int8()),
+    ("format_explanation",  pa.string()),
+])
+
+
+def _failed_evaluation(explanation: str) -> dict:
+    """Resultado de una fila que no se ha podido evaluar."""
+    return {
+        "content_score": None, "content_explanation": explanation,
+        "format_score":  None, "format_explanation":  explanation,
+    }
+
+
+EVALUATION_FIELDS = [
+    "content_score", "content_explanation",
+    "format_score",  "format_explanation",
+]
+
+
+def _clean_pairs(df: pd.DataFrame) -> tuple:
+    """
+    Normaliza las columnas 'ticket' y 'reply' (strings Arrow, sin nulos ni
+    espacios sobrantes) y calcula con una sola máscara vectorizada qué filas
+    merecen una llamada al LLM: ambos textos no vacíos y reply distinta del
+    ticket (una reply que repite el ticket no necesita evaluarse).
+
+    Returns:
+        (DataFrame normalizado con índice 0..n-1, máscara booleana de filas válidas)
+    """
+    df = df.reset_index(drop=True)
+    for column in ("ticket", "reply"):
+        df[column] = df[column].astype("string[pyarrow]").fillna("").str.strip()
+    valid = (
+        (df["ticket"].str.len() >= 1)
+        & (df["reply"].str.len() >= 1)
+        & (df["ticket"] != df["reply"])
     )
+    return df, valid
+
+
+def _pairs_to_evaluate(df: pd.DataFrame, valid: pd.Series) -> list:
+    """Lista de (idx, ticket, reply) de las filas válidas."""
+    selected = df[valid]
+    return list(zip(
+        selected.index, selected["ticket"].to_numpy(), selected["reply"].to_numpy(),
+    ))
+
+
+class PendingPair(NamedTuple):
+    """Un par (ticket, reply) pendiente y las filas del DataFrame que lo repiten."""
+    ticket: str
+    reply:  str
+    rows:   list
+
+
+def _group_pairs(pairs: list) -> dict:
+    """
+    Agrupa por cache_key los (idx, ticket, reply) de _pairs_to_evaluate, de
+    modo que un par repetido en la entrada se envíe al LLM una sola vez.
+
+    Returns:
+        Dict cache_key → PendingPair, en el orden de la primera aparición.
+    """
+    groups = {}
+    for idx, ticket, reply in pairs:
+        key = cache_key(ticket, reply)
+        if key in groups:
+            groups[key].rows.append(idx)
+        else:
+            groups[key] = PendingPair(ticket, reply, [idx])
+    return groups
 
-    result = json.loads(response.choices[0].message.content.strip())
 
-    required_fields = {
-        "content_score", "content_explanation",
-        "format_score",  "format_explanation",
+def _new_results(n: int) -> dict:
+    """
+    Buffers preasignados para las 4 columnas de evaluación. Un score de -1
+    marca "sin score"; una explicación None, fila aún no resuelta.
+    """
+    return {
+        "content_score":       np.full(n, -1, dtype=np.int8),
+        "content_explanation": np.empty(n, dtype=object),
+        "format_score":        np.full(n, -1, dtype=np.int8),
+        "format_explanation":  np.empty(n, dtype=object),
     }
-    missing = required_fields - result.keys()
-    if missing:
-        raise ValueError(f"Campos faltantes en la respuesta: {missing}")
 
-    for field in ("content_score", "format_score"):
-        score = result[field]
-        if not isinstance(score, int) or not (1 <= score <= 5):
-            raise ValueError(f"Score inválido en '{field}': {score!r}")
 
-    return result
+def _store_result(results: dict, idx, evaluation: dict) -> None:
+    """
+    Escribe una evaluación directamente en la posición idx de los buffers
+    (o en varias a la vez, si idx es una lista de filas).
+    """
+    for field in EVALUATION_FIELDS:
+        value = evaluation[field]
+        if field.endswith("_score") and value is None:
+            value = -1
+        results[field][idx] = value
 
 
-# ── Evaluación del DataFrame ───────────────────────────────────────────────────
+def _store_skipped(df: pd.DataFrame, valid: pd.Series, results: dict) -> None:
+    """
+    Rellena de una vez, sin recorrer filas, el resultado de las filas
+    descartadas por _clean_pairs.
+    """
+    skipped = np.flatnonzero(~valid.to_numpy(dtype=bool))
+    if not len(skipped):
+        return
+    logger.warning(f"{len(skipped)} filas vacías o degeneradas — se omiten sin llamar al LLM.")
+
+    has_text = (df["ticket"].ne("") & df["reply"].ne("")).to_numpy(dtype=bool)[skipped]
+    explanation = np.where(has_text, "Reply identical to ticket", "Missing data")
+    results["content_explanation"][skipped] = explanation
+    results["format_explanation"][skipped]  = explanation
+
+
+def _attach_results(df: pd.DataFrame, results: dict) -> pd.DataFrame:
+    """Añade los buffers al DataFrame como columnas, sin concat intermedio."""
+    for field in EVALUATION_FIELDS:
+        values = results[field]
+        if field.endswith("_score"):
+            values = pd.arrays.IntegerArray(values, mask=values == -1)
+        df[field] = values
+    return df
+
+
+async def _eval_one(session: GroqSession, idx: int, ticket: str, reply: str) -> tuple:
+    """
+    Evalúa una fila. Devuelve (idx, evaluación) o (idx, excepción) para que
+    el llamador pueda procesar los resultados según van llegando.
+    """
+    try:
+        evaluation = await call_llm_api(session, ticket, reply)
+    except Exception as e:
+        return idx, e
+    logger.info(
+        f"  ✓ Fila {idx}: Content: {evaluation['content_score']}/5 | "
+        f"Format: {evaluation['format_score']}/5"
+    )
+    return idx, evaluation
+
 
-def evaluate_tickets(df: pd.DataFrame) -> pd.DataFrame:
+def _load_checkpoint(checkpoint_dir: str) -> pd.DataFrame | None:
+    """
+    Lee todos los fragmentos del checkpoint. Un fragmento ilegible (p. ej. un
+    archivo a medio escribir de una versión anterior) se avisa y se omite:
+    sus pares simplemente se vuelven a evaluar.
+
+    Returns:
+        DataFrame con las columnas de CHECKPOINT_SCHEMA sin claves repetidas,
+        o None si no hay nada aprovechable.
     """
-    Itera sobre el DataFrame y evalúa cada par (ticket, reply).
+    tables = []
+    for path in sorted(glob.glob(os.path.join(checkpoint_dir, "part-*.parquet"))):
+        try:
+            tables.append(pq.read_table(path, schema=CHECKPOINT_SCHEMA))
+        except (OSError, pa.ArrowException) as e:
+            logger.warning(f"Fragmento de checkpoint ilegible, se omite: {path} ({e})")
+    if not tables:
+        return None
+
+    return pa.concat_tables(tables).to_pandas().drop_duplicates(subset=["key"])
+
+
+def _store_checkpointed(groups: dict, previous: pd.DataFrame, results: dict) -> set:
+    """
+    Copia en los buffers, con un merge vectorizado, las evaluaciones de los
+    pares pendientes cuya cache_key ya está en el checkpoint, en todas las
+    filas que repiten cada par.
+
+    Returns:
+        Conjunto de cache_keys resueltas desde el checkpoint.
+    """
+    matched = pd.DataFrame({"key": list(groups)}).merge(previous, on="key", how="inner")
+    rows = [groups[key].rows for key in matched["key"]]
+    if not rows:
+        return set()
+
+    positions = np.concatenate(rows)
+    counts = [len(r) for r in rows]
+    for field in EVALUATION_FIELDS:
+        if field.endswith("_score"):
+            values = matched[field].fillna(-1).to_numpy(dtype=np.int8)
+        else:
+            values = matched[field].to_numpy(dtype=object)
+        results[field][positions] = np.repeat(values, counts)
+    return set(matched["key"])
+
+
+def _write_checkpoint_part(checkpoint_dir: str, records: list) -> None:
+    """
+    Escribe un fragmento del checkpoint en un archivo propio. Se escribe
+    primero a un .tmp y se renombra con os.replace, así que un fragmento
+    visible siempre está completo aunque el proceso muera a mitad.
+    """
+    path = os.path.join(checkpoint_dir, f"part-{uuid.uuid4().hex}.parquet")
+    pq.write_table(
+        pa.Table.from_pylist(records, schema=CHECKPOINT_SCHEMA), f"{path}.tmp",
+        compression="snappy",
+    )
+    os.replace(f"{path}.tmp", path)
+
+
+async def evaluate_tickets(
+    session: GroqSession, df: pd.DataFrame, checkpoint_dir: str = CHECKPOINT_DIR,
+) -> pd.DataFrame:
+    """
+    Evalúa cada par (ticket, reply) con llamadas concurrentes a la API,
+    limitadas a MAX_CONCURRENCY peticiones en vuelo.
     Si una fila falla, registra el error y continúa con las siguientes.
 
+    El conjunto de tareas en vuelo se rellena en cuanto termina cualquiera,
+    así que una fila lenta no frena a las demás.
+    Cada CHUNK evaluaciones correctas se escribe un fragmento Parquet nuevo
+    en checkpoint_dir. Si ya hay fragmentos (ejecución interrumpida), las
+    filas cuya cache_key contienen no se vuelven a enviar al LLM.
+
     Args:
-        df: DataFrame con columnas 'ticket' y 'reply'.
+        session:        Sesión abierta con groq_session().
+        df:             DataFrame con columnas 'ticket' y 'reply'.
+        checkpoint_dir: Directorio de los fragmentos del checkpoint.
 
     Returns:
         DataFrame original con las 4 columnas de evaluación añadidas.
     """
-    results = []
+    df, valid = _clean_pairs(df)
     total = len(df)
+    results = _new_results(len(df))
+    _store_skipped(df, valid, results)
+
+    pending = _group_pairs(_pairs_to_evaluate(df, valid))
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    previous = _load_checkpoint(checkpoint_dir)
+    if previous is not None:
+        logger.info(f"Checkpoint encontrado: {len(previous)} pares ya evaluados.")
+        for key in _store_checkpointed(pending, previous, results):
+            del pending[key]
+
+    logger.info(
+        f"Evaluando {sum(len(pair.rows) for pair in pending.values())}/{total} filas "
+        f"({len(pending)} pares distintos, concurrencia: {MAX_CONCURRENCY})..."
+    )
+
+    queue = iter(pending.items())
+    in_flight = {}  # tarea → cache_key del par que evalúa
+    records = []
+    try:
+        while True:
+            for key, pair in itertools.islice(queue, MAX_CONCURRENCY - len(in_flight)):
+                task = asyncio.create_task(_eval_one(session, pair.rows[0], pair.ticket, pair.reply))
+                in_flight[task] = key
+            if not in_flight:
+                break
+
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                key = in_flight.pop(task)
+                rows = pending[key].rows
+                idx, evaluation = task.result()
+                if isinstance(evaluation, Exception):
+                    logger.error(f"  ✗ Error permanente en fila {idx}: {evaluation}")
+                    _store_result(results, rows, _failed_evaluation(f"Error: {evaluation}"))
+                    continue
+
+                _store_result(results, rows, evaluation)
+                records.append({"key": key, **evaluation})
+
+            if len(records) >= CHUNK:
+                _write_checkpoint_part(checkpoint_dir, records)
+                records = []
+    finally:
+        for task in in_flight:
+            task.cancel()
+        if records:
+            _write_checkpoint_part(checkpoint_dir, records)
+
+    return _attach_results(df, results)
+
+
+def _evaluate_shard(
+    shard_id: int, df: pd.DataFrame, workers: int, checkpoint_dir: str, output_dir: str,
+) -> str:
+    """
+    Evalúa un fragmento del DataFrame dentro de un worker y escribe el
+    resultado en un Parquet parcial dentro de output_dir. Con 'spawn' cada
+    proceso reimporta el módulo y abre su propia groq_session() (los clientes
+    no sobreviven a un fork), con GROQ_RPM / workers de presupuesto.
+
+    Todos los workers comparten checkpoint_dir: los fragmentos se identifican
+    por cache_key y no por worker, así que un checkpoint escrito
+    con cualquier número de procesos se aprovecha con cualquier otro.
+
+    Returns:
+        Ruta del Parquet parcial.
+    """
+    part_file = os.path.join(output_dir, f"part{shard_id}.parquet")
+    df_part = asyncio.run(run_evaluation(
+        evaluate_tickets, df, checkpoint_dir, rpm=GROQ_RPM / workers,
+    ))
+    to_output_frame(df_part).to_parquet(part_file, engine="pyarrow", compression="snappy", index=False)
+    return part_file
 
-    for idx, row in df.iterrows():
-        logger.info(f"Evaluando fila {idx + 1}/{total}...")
 
-        ticket = str(row.get("ticket", "")).strip()
-        reply  = str(row.get("reply",  "")).strip()
+def evaluate_tickets_parallel(
+    df: pd.DataFrame, workers: int, checkpoint_dir: str = CHECKPOINT_DIR,
+) -> pd.DataFrame:
+    """
+    Reparte el DataFrame en `workers` fragmentos contiguos y evalúa cada uno
+    en un proceso distinto, cada uno con su propio bucle asyncio. Evita que el
+    parseo JSON y la gestión de tareas compitan por el GIL cuando la
+    concurrencia es muy alta.
+
+    Los Parquet parciales van a un directorio temporal que se borra siempre,
+    también si algún worker falla.
 
-        if not ticket or not reply:
-            logger.warning(f"Fila {idx}: datos vacíos, se omite.")
-            results.append({
-                "content_score": None, "content_explanation": "Missing data",
-                "format_score":  None, "format_explanation":  "Missing data",
-            })
+    Args:
+        df:             DataFrame con columnas 'ticket' y 'reply'.
+        workers:        Número de procesos.
+        checkpoint_dir: Directorio de checkpoint compartido por los workers.
+
+    Returns:
+        DataFrame con las 4 columnas de evaluación añadidas, en el orden original.
+    """
+    df = df.reset_index(drop=True)
+    size = -(-len(df) // workers)
+    shards = [df.iloc[start:start + size] for start in range(0, len(df), size)]
+    logger.info(f"Evaluando {len(df)} filas en {len(shards)} procesos...")
+
+    os.makedirs(os.path.dirname(OUTPUT_FILE) or ".", exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(OUTPUT_FILE) or ".") as output_dir:
+        with ProcessPoolExecutor(
+            max_workers=len(shards),
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            part_files = list(executor.map(
+                _evaluate_shard, range(len(shards)), shards,
+                [len(shards)] * len(shards),
+                [checkpoint_dir] * len(shards),
+                [output_dir] * len(shards),
+            ))
+
+        return pd.concat([pd.read_parquet(path) for path in part_files], ignore_index=True)
+
+
+def _batch_record_error(record: dict) -> str | None:
+    """
+    Mensaje de error de una línea de resultados del batch, o None si la
+    petición fue bien. El error puede venir en record["error"] o como
+    respuesta HTTP con status >= 400 en record["response"].
+    """
+    error = record.get("error")
+    response = record.get("response") or {}
+    if not error and response.get("status_code", 200) >= 400:
+        error = (response.get("body") or {}).get("error") or f"HTTP {response['status_code']}"
+    if isinstance(error, dict):
+        error = error.get("message") or orjson.dumps(error).decode()
+    return error or None
+
+
+async def evaluate_tickets_batch(session: GroqSession, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Evalúa el DataFrame con la Batch API de Groq en lugar de una petición
+    por fila: sube un JSONL con todas las peticiones, espera a que el batch
+    termine y une las respuestas con las filas por custom_id.
+
+    Args:
+        session: Sesión abierta con groq_session().
+        df:      DataFrame con columnas 'ticket' y 'reply'.
+
+    Returns:
+        DataFrame original con las 4 columnas de evaluación añadidas.
+
+    Raises:
+        RuntimeError: Si el batch termina sin archivo de resultados ni de errores.
+    """
+    df, valid = _clean_pairs(df)
+    results = _new_results(len(df))
+    _store_skipped(df, valid, results)
+
+    pending = {}  # custom_id (primera fila del par) → (cache_key, PendingPair)
+    lines = []
+    for key, pair in _group_pairs(_pairs_to_evaluate(df, valid)).items():
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            _store_result(results, pair.rows, cached)
             continue
 
-        try:
-            evaluation = call_llm_api(ticket, reply)
-            results.append(evaluation)
-            logger.info(
-                f"  ✓ Content: {evaluation['content_score']}/5 | "
-                f"Format: {evaluation['format_score']}/5"
-            )
-        except Exception as e:
-            logger.error(f"  ✗ Error permanente en fila {idx}: {e}")
-            results.append({
-                "content_score": None, "content_explanation": f"Error: {e}",
-                "format_score":  None, "format_explanation":  f"Error: {e}",
-            })
+        custom_id = str(pair.rows[0])
+        pending[custom_id] = (key, pair)
+        lines.append(orjson.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": build_request_body(pair.ticket, pair.reply),
+        }, default=dict))  # orjson no serializa MappingProxyType por sí solo
+
+    if not lines:
+        logger.info("Todas las filas estaban en caché: no se crea ningún batch.")
+        return _attach_results(df, results)
+
+    input_file = await session.client.files.create(
+        file=("tickets_batch.jsonl", b"\n".join(lines)),
+        purpose="batch",
+    )
+    batch = await session.client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    logger.info(f"Batch {batch.id} creado con {len(lines)} peticiones.")
+
+    started = time.monotonic()
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+        batch = await session.client.batches.retrieve(batch.id)
+        logger.info(
+            f"  Batch {batch.id}: {batch.status} "
+            f"({time.monotonic() - started:.0f}s)"
+        )
+
+    # Las peticiones correctas van al archivo de resultados y las fallidas
+    # al de errores: hay que leer ambos para cubrir todas las filas.
+    file_ids = [file_id for file_id in (batch.output_file_id, batch.error_file_id) if file_id]
+    if not file_ids:
+        raise RuntimeError(f"El batch {batch.id} terminó con estado '{batch.status}' sin resultados.")
+
+    for file_id in file_ids:
+        content = await session.client.files.content(file_id)
+        for line in (await content.text()).splitlines():
+            if not line.strip():
+                continue
+            record = orjson.loads(line)
+            custom_id = record["custom_id"]
+            key, pair = pending[custom_id]
+            try:
+                error = _batch_record_error(record)
+                if error:
+                    raise RuntimeError(error)
+                body = record["response"]["body"]
+                evaluation = parse_evaluation(body["choices"][0]["message"]["content"])
+                await asyncio.to_thread(cache.set, key, evaluation)
+                _store_result(results, pair.rows, evaluation)
+            except Exception as e:
+                logger.error(f"  ✗ Error permanente en fila {custom_id}: {e}")
+                _store_result(results, pair.rows, _failed_evaluation(f"Error: {e}"))
+
+    for custom_id, (_, pair) in pending.items():
+        if results["content_explanation"][pair.rows[0]] is not None:
+            continue
+        logger.error(f"  ✗ Fila {custom_id} sin respuesta en el batch {batch.id}.")
+        _store_result(
+            results, pair.rows,
+            _failed_evaluation(f"Error: sin respuesta en el batch ({batch.status})"),
+        )
 
-    return pd.concat([df.reset_index(drop=True), pd.DataFrame(results)], axis=1)
+    return _attach_results(df, results)
 
 
-# ── Lectura y validación del CSV ───────────────────────────────────────────────
+# ── Lectura y validación de la entrada ─────────────────────────────────────────
 
 def load_and_validate_csv(filepath: str) -> pd.DataFrame:
     """
-    Lee el CSV y comprueba que tiene las columnas necesarias.
+    Lee el CSV (o Parquet) y comprueba que tiene las columnas necesarias.
+
+    El CSV se parsea con el motor multihilo de PyArrow directamente a columnas
+    de strings Arrow, leyendo solo 'ticket' y 'reply'. Si la entrada ya es
+    un .parquet se lee con pd.read_parquet.
 
     Args:
-        filepath: Ruta al archivo CSV.
+        filepath: Ruta al archivo CSV o Parquet.
 
     Returns:
-        DataFrame validado.
+        DataFrame validado con las columnas 'ticket' y 'reply'.
 
     Raises:
         FileNotFoundError: Si el archivo no existe.
@@ -215,12 +824,25 @@ def load_and_validate_csv(filepath: str) -> pd.DataFrame:
     if not os.path.exists(filepath):
         raise FileNotFoundError(f"No se encontró: {filepath}")
 
-    df = pd.read_csv(filepath)
-    logger.info(f"CSV cargado: {len(df)} filas | columnas: {list(df.columns)}")
+    is_parquet = filepath.endswith(".parquet")
+    if is_parquet:
+        columns = pq.read_schema(filepath).names
+    else:
+        columns = list(pd.read_csv(filepath, nrows=0).columns)
 
-    missing_cols = {"ticket", "reply"} - set(df.columns)
+    missing_cols = {"ticket", "reply"} - set(columns)
     if missing_cols:
-        raise ValueError(f"Columnas faltantes en el CSV: {missing_cols}")
+        source = "Parquet" if is_parquet else "CSV"
+        raise ValueError(f"Columnas faltantes en el {source}: {missing_cols}")
+
+    if is_parquet:
+        df = pd.read_parquet(filepath, columns=["ticket", "reply"], dtype_backend="pyarrow")
+    else:
+        df = pd.read_csv(
+            filepath, engine="pyarrow", dtype_backend="pyarrow", usecols=["ticket", "reply"],
+        )
+    df = df.astype({"ticket": "string[pyarrow]", "reply": "string[pyarrow]"})
+    logger.info(f"Entrada cargada: {len(df)} filas | columnas: {columns}")
 
     empty_rows = df[["ticket", "reply"]].isnull().any(axis=1).sum()
     if empty_rows > 0:
@@ -229,33 +851,118 @@ def load_and_validate_csv(filepath: str) -> pd.DataFrame:
     return df
 
 
+# ── Escritura del resultado ────────────────────────────────────────────────────
+
+OUTPUT_COLUMNS = [
+    "ticket", "reply",
+    "content_score", "content_explanation",
+    "format_score",  "format_explanation",
+]
+
+
+def to_output_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Selecciona las columnas de salida con tipos compactos: scores como Int8
+    nullable y explicaciones como strings respaldados por Arrow, lo que
+    permite un encoding por columnas compacto en Parquet.
+    """
+    return df[OUTPUT_COLUMNS].astype({
+        "content_score":       pd.Int8Dtype(),
+        "format_score":        pd.Int8Dtype(),
+        "content_explanation": pd.StringDtype("pyarrow"),
+        "format_explanation":  pd.StringDtype("pyarrow"),
+    })
+
+
+def save_output(df: pd.DataFrame, filepath: str, fmt: str = "parquet") -> str:
+    """
+    Guarda el DataFrame evaluado en Parquet (Snappy) o CSV.
+
+    Args:
+        df:       DataFrame devuelto por to_output_frame().
+        filepath: Ruta de salida; la extensión se ajusta al formato elegido.
+        fmt:      "parquet" o "csv".
+
+    Returns:
+        Ruta final del archivo escrito.
+    """
+    filepath = f"{os.path.splitext(filepath)[0]}.{fmt}"
+    if fmt == "parquet":
+        df.to_parquet(filepath, engine="pyarrow", compression="snappy", index=False)
+    else:
+        df.to_csv(filepath, index=False, encoding="utf-8")
+
+    return filepath
+
+
 # ── Main ───────────────────────────────────────────────────────────────────────
 
+def parse_args(argv: list | None = None) -> argparse.Namespace:
+    """Lee los argumentos de línea de comandos."""
+    parser = argparse.ArgumentParser(description="Evalúa replies de tickets con un LLM.")
+    parser.add_argument(
+        "--input", default=INPUT_FILE,
+        help=f"CSV o Parquet con columnas 'ticket' y 'reply' (por defecto: {INPUT_FILE}).",
+    )
+    parser.add_argument(
+        "--format", choices=("csv", "parquet"), default="parquet",
+        help="Formato del archivo de salida (por defecto: parquet).",
+    )
+    parser.add_argument(
+        "--batch", action="store_true",
+        help=f"Usa la Batch API de Groq (solo con {BATCH_MIN_ROWS} filas o más).",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help=f"Procesos para la evaluación concurrente (por defecto: 1; "
+             f"este equipo tiene {os.cpu_count()} CPUs).",
+    )
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers debe ser 1 o más.")
+    if args.batch and args.workers > 1:
+        parser.error("--batch y --workers son incompatibles: la Batch API no reparte en procesos.")
+    return args
+
+
 def main():
-    df_input     = load_and_validate_csv(INPUT_FILE)
-    df_evaluated = evaluate_tickets(df_input)
+    args = parse_args()
+
+    df_input = load_and_validate_csv(args.input)
+    if args.batch and len(df_input) >= BATCH_MIN_ROWS:
+        df_evaluated = asyncio.run(run_evaluation(evaluate_tickets_batch, df_input))
+    else:
+        if args.batch:
+            logger.info(
+                f"Menos de {BATCH_MIN_ROWS} filas: se usa la evaluación concurrente "
+                "en lugar de la Batch API."
+            )
+        if args.workers > 1 and len(df_input) > 1:
+            df_evaluated = evaluate_tickets_parallel(df_input, args.workers)
+        else:
+            df_evaluated = asyncio.run(run_evaluation(evaluate_tickets, df_input))
+
+    df_output   = to_output_frame(df_evaluated)
+    output_file = save_output(df_output, OUTPUT_FILE, args.format)
 
-    output_columns = [
-        "ticket", "reply",
-        "content_score", "content_explanation",
-        "format_score",  "format_explanation",
-    ]
-    df_output = df_evaluated[output_columns]
-    df_output.to_csv(OUTPUT_FILE, index=False, encoding="utf-8")
+    # Con el resultado final ya escrito, el checkpoint deja de ser necesario.
+    shutil.rmtree(CHECKPOINT_DIR, ignore_errors=True)
 
-    logger.info(f"✅ Evaluación completada. Resultado guardado en: {OUTPUT_FILE}")
+    logger.info(f"✅ Evaluación completada. Resultado guardado en: {output_file}")
 
     print("\n" + "=" * 55)
     print("          RESUMEN DE EVALUACIÓN")
     print("=" * 55)
     print(f"Total de tickets procesados : {len(df_output)}")
-    print(f"Content Score — Media: {df_output['content_score'].mean():.2f} "
-          f"| Min: {df_output['content_score'].min()} "
-          f"| Max: {df_output['content_score'].max()}")
-    print(f"Format Score  — Media: {df_output['format_score'].mean():.2f} "
-          f"| Min: {df_output['format_score'].min()} "
-          f"| Max: {df_output['format_score'].max()}")
-    print(f"Filas con error             : {df_output['content_score'].isnull().sum()}")
+    stats = df_output[["content_score", "format_score"]].agg(["mean", "min", "max", "count"])
+    n_errors = len(df_output) - int(stats.loc["count", "content_score"])
+    print(f"Content Score — Media: {stats.loc['mean', 'content_score']:.2f} "
+          f"| Min: {stats.loc['min', 'content_score']:.0f} "
+          f"| Max: {stats.loc['max', 'content_score']:.0f}")
+    print(f"Format Score  — Media: {stats.loc['mean', 'format_score']:.2f} "
+          f"| Min: {stats.loc['min', 'format_score']:.0f} "
+          f"| Max: {stats.loc['max', 'format_score']:.0f}")
+    print(f"Filas con error             : {n_errors}")
     print("=" * 55)
 
 
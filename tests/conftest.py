@@ -0,0 +1,30 @@
+"""
+Configuración común de los tests.
+
+main.py exige GROQ_API_KEY y abre la caché en disco al importarse, así que
+el entorno se prepara aquí, antes de que los tests importen el módulo.
+"""
+
+import os
+import sys
+import tempfile
+
+import diskcache
+import pytest
+
+_CACHE_DIR = tempfile.TemporaryDirectory(prefix="groq_cache_")
+
+os.environ.setdefault("GROQ_API_KEY", "gsk_test")
+os.environ["GROQ_CACHE_DIR"] = _CACHE_DIR.name
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import main  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Cada test usa una caché vacía dentro de su tmp_path."""
+    cache = diskcache.Cache(str(tmp_path / "groq_cache"))
+    monkeypatch.setattr(main, "cache", cache)
+    yield cache
+    cache.close()
@@ -7,6 +7,9 @@ import json
 import pytest
 import pandas as pd
 from unittest.mock import MagicMock
+from pydantic import ValidationError
+
+import main
 
 
 # ── Fixtures ──────────────────────────────────────────────────────────────────
@@ -30,6 +33,27 @@ class TestLoadAndValidateCsv:
         assert list(df.columns) == ["ticket", "reply"]
         assert len(df) == 1
 
+    def test_loads_with_pyarrow_engine(self, tmp_path):
+        csv_file = tmp_path / "tickets.csv"
+        csv_file.write_text('ticket,reply,extra\n"hello, there",world,1\n')
+        df = main.load_and_validate_csv(str(csv_file))
+        assert list(df.columns) == ["ticket", "reply"]
+        assert df["ticket"].iloc[0] == "hello, there"
+        assert df["reply"].dtype == "string[pyarrow]"
+
+    def test_loads_parquet_input(self, tmp_path):
+        parquet_file = tmp_path / "tickets.parquet"
+        pd.DataFrame({"ticket": ["hello"], "reply": ["world"], "extra": [1]}).to_parquet(parquet_file)
+        df = main.load_and_validate_csv(str(parquet_file))
+        assert list(df.columns) == ["ticket", "reply"]
+        assert df["reply"].iloc[0] == "world"
+
+    def test_missing_columns_names_the_source(self, tmp_path):
+        parquet_file = tmp_path / "bad.parquet"
+        pd.DataFrame({"message": ["hello"]}).to_parquet(parquet_file)
+        with pytest.raises(ValueError, match="en el Parquet"):
+            main.load_and_validate_csv(str(parquet_file))
+
     def test_raises_on_missing_file(self):
         import os
         with pytest.raises(FileNotFoundError):
@@ -53,7 +77,7 @@ class TestBuildUserPrompt:
     def test_returns_valid_json(self):
         ticket = "My order is late."
         reply = "We apologize for the delay."
-        result = json.dumps({"ticket": ticket, "reply": reply}, ensure_ascii=False)
+        result = main.build_user_prompt(ticket, reply)
         parsed = json.loads(result)
         assert parsed["ticket"] == ticket
         assert parsed["reply"] == reply
@@ -61,63 +85,105 @@ class TestBuildUserPrompt:
     def test_handles_special_characters(self):
         ticket = 'Ticket with "quotes" and \nnewlines'
         reply = "Reply with 'apostrophes'"
-        result = json.dumps({"ticket": ticket, "reply": reply}, ensure_ascii=False)
+        result = main.build_user_prompt(ticket, reply)
         parsed = json.loads(result)
         assert parsed["ticket"] == ticket
 
     def test_handles_unicode(self):
         ticket = "Problema con mi pedido número 1234 🚚"
         reply = "Lamentamos el inconveniente, señor."
-        result = json.dumps({"ticket": ticket, "reply": reply}, ensure_ascii=False)
+        result = main.build_user_prompt(ticket, reply)
         assert "🚚" in result
 
+    def test_build_user_prompt_roundtrips(self):
+        ticket = 'Pedido "urgente" nº 1234 🚚\ncon salto de línea'
+        reply = "Lamentamos el inconveniente."
+        result = main.build_user_prompt(ticket, reply)
+        assert json.loads(result) == {"ticket": ticket, "reply": reply}
+        assert "🚚" in result
 
-# ── Tests de validación del schema de respuesta ───────────────────────────────
+    def test_build_user_prompt_is_compact(self):
+        assert main.build_user_prompt("a", "b") == '{"ticket":"a","reply":"b"}'
 
-class TestResponseValidation:
 
-    def validate_response(self, result: dict):
-        required_fields = {
-            "content_score", "content_explanation",
-            "format_score", "format_explanation"
-        }
-        missing = required_fields - result.keys()
-        if missing:
-            raise ValueError(f"Campos faltantes: {missing}")
-        for field in ("content_score", "format_score"):
-            score = result[field]
-            if not isinstance(score, int) or not (1 <= score <= 5):
-                raise ValueError(f"Score inválido en '{field}': {score}")
-        return result
-
-    def test_valid_response_passes(self):
-        result = self.validate_response(VALID_LLM_RESPONSE)
-        assert result["content_score"] == 4
+# ── Tests de la clave de caché ────────────────────────────────────────────────
+
+class TestCacheKey:
+
+    def test_same_pair_same_key(self):
+        assert main.cache_key("ticket", "reply") == main.cache_key("ticket", "reply")
+
+    def test_field_boundary_is_unambiguous(self):
+        assert main.cache_key("ab", "c") != main.cache_key("a", "bc")
+
+
+# ── Tests del filtrado previo de filas ────────────────────────────────────────
+
+class TestRowPrefilter:
+
+    def build_mask(self, df: pd.DataFrame) -> pd.Series:
+        return main._clean_pairs(df)[1]
+
+    def test_keeps_valid_rows(self):
+        df = pd.DataFrame({"ticket": ["My order is late."], "reply": ["Sorry!"]})
+        assert self.build_mask(df).tolist() == [True]
+
+    def test_drops_empty_and_null_rows(self):
+        df = pd.DataFrame({"ticket": ["  ", None, "ok"], "reply": ["r", "r", ""]})
+        assert self.build_mask(df).tolist() == [False, False, False]
+
+    def test_drops_reply_identical_to_ticket(self):
+        df = pd.DataFrame({"ticket": ["Hello"], "reply": [" Hello "]})
+        assert self.build_mask(df).tolist() == [False]
+
+    def test_normalizes_text_columns(self):
+        df = pd.DataFrame({"ticket": ["  Hi  ", None]}, index=[7, 9]).assign(reply=["ok", "r"])
+        cleaned, _ = main._clean_pairs(df)
+        assert cleaned.index.tolist() == [0, 1]
+        assert cleaned["ticket"].tolist() == ["Hi", ""]
+
+
+# ── Tests del modelo Pydantic de la respuesta ─────────────────────────────────
+
+class TestEvaluationModel:
+
+    def test_valid_json_passes(self):
+        assert main.parse_evaluation(json.dumps(VALID_LLM_RESPONSE)) == VALID_LLM_RESPONSE
+
+    def test_extra_fields_are_dropped(self):
+        payload = json.dumps({**VALID_LLM_RESPONSE, "confidence": 0.9})
+        assert "confidence" not in main.parse_evaluation(payload)
 
     def test_missing_field_raises(self):
-        bad_response = {"content_score": 4, "content_explanation": "ok"}
-        with pytest.raises(ValueError, match="Campos faltantes"):
-            self.validate_response(bad_response)
+        with pytest.raises(ValueError, match="format_score: Field required"):
+            main.parse_evaluation('{"content_score": 4}')
 
     def test_score_out_of_range_raises(self):
-        bad_response = {**VALID_LLM_RESPONSE, "content_score": 7}
-        with pytest.raises(ValueError):
-            self.validate_response(bad_response)
+        payload = json.dumps({**VALID_LLM_RESPONSE, "format_score": 0})
+        with pytest.raises(ValueError, match="format_score"):
+            main.parse_evaluation(payload)
 
     def test_score_as_string_raises(self):
-        bad_response = {**VALID_LLM_RESPONSE, "format_score": "5"}
+        payload = json.dumps({**VALID_LLM_RESPONSE, "content_score": "5"})
         with pytest.raises(ValueError):
-            self.validate_response(bad_response)
+            main.parse_evaluation(payload)
 
     def test_minimum_score_valid(self):
-        response = {**VALID_LLM_RESPONSE, "content_score": 1, "format_score": 1}
-        result = self.validate_response(response)
-        assert result["content_score"] == 1
+        payload = json.dumps({**VALID_LLM_RESPONSE, "content_score": 1, "format_score": 1})
+        assert main.parse_evaluation(payload)["content_score"] == 1
 
     def test_maximum_score_valid(self):
-        response = {**VALID_LLM_RESPONSE, "content_score": 5, "format_score": 5}
-        result = self.validate_response(response)
-        assert result["format_score"] == 5
+        payload = json.dumps({**VALID_LLM_RESPONSE, "content_score": 5, "format_score": 5})
+        assert main.parse_evaluation(payload)["format_score"] == 5
+
+    def test_error_message_is_one_line(self):
+        payload = json.dumps({**VALID_LLM_RESPONSE, "content_score": 9, "format_score": "5"})
+        with pytest.raises(ValueError) as excinfo:
+            main.parse_evaluation(payload)
+        message = str(excinfo.value)
+        assert "\n" not in message
+        assert "errors.pydantic.dev" not in message
+        assert not isinstance(excinfo.value, ValidationError)
 
 
 # ── Tests de escritura del CSV de salida ──────────────────────────────────────
@@ -153,4 +219,26 @@ class TestOutputCsv:
         df = pd.DataFrame(rows)
         output_path = tmp_path / "out.csv"
         df.to_csv(output_path, index=False)
-        assert len(pd.read_csv(output_path)) == 5
\ No newline at end of file
+        assert len(pd.read_csv(output_path)) == 5
+
+
+# ── Tests de escritura del Parquet de salida ──────────────────────────────────
+
+class TestOutputParquet:
+
+    def test_roundtrip_preserves_typed_columns(self, tmp_path):
+        df = pd.DataFrame([
+            {"ticket": "t1", "reply": "r1",
+             "content_score": 4, "content_explanation": "Good.",
+             "format_score": 5, "format_explanation": "Perfect."},
+            {"ticket": "t2", "reply": "",
+             "content_score": None, "content_explanation": "Missing data",
+             "format_score": None, "format_explanation": "Missing data"},
+        ])
+        output_path = main.save_output(
+            main.to_output_frame(df), str(tmp_path / "out.parquet"), "parquet",
+        )
+        df_loaded = pd.read_parquet(output_path)
+        assert df_loaded["content_score"].dtype == pd.Int8Dtype()
+        assert df_loaded["content_score"].isna().sum() == 1
+        assert len(df_loaded) == 2
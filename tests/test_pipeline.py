@@ -0,0 +1,439 @@
+"""
+Tests de las rutas asíncronas del evaluador (evaluación concurrente y
+las rutas que se apoyan en ella).
+
+Las llamadas a Groq se sirven con httpx.MockTransport a través de
+groq_session(transport=...), así que no salen a la red.
+Ejecutar con: pytest tests/test_pipeline.py -v
+"""
+
+import os
+import json
+import asyncio
+
+import httpx
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+import main
+
+
+# ── Fixtures ──────────────────────────────────────────────────────────────────
+
+def evaluation_for(ticket: str) -> dict:
+    """Evaluación determinista que deja rastro del ticket evaluado."""
+    return {
+        "content_score": 4, "content_explanation": f"content {ticket}",
+        "format_score":  5, "format_explanation":  f"format {ticket}",
+    }
+
+
+def completion_response(content: str) -> httpx.Response:
+    return httpx.Response(200, json={
+        "id": "chatcmpl-test", "object": "chat.completion", "created": 0,
+        "model": main.MODEL,
+        "choices": [{
+            "index": 0, "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content},
+        }],
+    })
+
+
+def prompt_of(request: httpx.Request) -> dict:
+    """Par (ticket, reply) enviado en una petición de chat completion."""
+    return json.loads(json.loads(request.content)["messages"][1]["content"])
+
+
+class FakeGroq:
+    """Handler para MockTransport que registra las peticiones recibidas."""
+
+    def __init__(self, fail_tickets=(), delays=None):
+        self.fail_tickets = set(fail_tickets)
+        self.delays = delays or {}
+        self.calls = []
+        self.completed = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        ticket = prompt_of(request)["ticket"]
+        self.calls.append(ticket)
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delays.get(ticket, 0))
+        finally:
+            self.in_flight -= 1
+            self.completed.append(ticket)
+        if ticket in self.fail_tickets:
+            return httpx.Response(400, json={"error": {"message": "bad request"}})
+        return completion_response(json.dumps(evaluation_for(ticket)))
+
+
+def run(evaluate, df, handler, *args):
+    async def _run():
+        async with main.groq_session(transport=httpx.MockTransport(handler)) as session:
+            return await evaluate(session, df, *args)
+    return asyncio.run(_run())
+
+
+def checkpoint_record(ticket: str, reply: str) -> dict:
+    return {"key": main.cache_key(ticket, reply), **evaluation_for(ticket)}
+
+
+def checkpoint_rows(checkpoint_dir: str) -> int:
+    return sum(
+        pq.read_metadata(os.path.join(checkpoint_dir, name)).num_rows
+        for name in os.listdir(checkpoint_dir)
+    )
+
+
+@pytest.fixture
+def tickets():
+    return pd.DataFrame({
+        "ticket": [f"ticket {i}" for i in range(5)],
+        "reply":  [f"reply {i}" for i in range(5)],
+    })
+
+
+@pytest.fixture
+def checkpoint_dir(tmp_path):
+    return str(tmp_path / "checkpoint")
+
+
+# ── Tests de la evaluación concurrente ────────────────────────────────────────
+
+class TestEvaluateTickets:
+
+    def test_requests_run_concurrently(self, tickets, checkpoint_dir):
+        fake = FakeGroq(delays={f"ticket {i}": 0.05 for i in range(5)})
+        run(main.evaluate_tickets, tickets, fake, checkpoint_dir)
+        assert fake.peak_in_flight == 5
+
+    def test_concurrency_is_bounded(self, checkpoint_dir, monkeypatch):
+        monkeypatch.setattr(main, "MAX_CONCURRENCY", 2)
+        df_input = pd.DataFrame({"ticket": [f"t{i}" for i in range(6)], "reply": ["r"] * 6})
+        fake = FakeGroq(delays={f"t{i}": 0.02 for i in range(6)})
+        run(main.evaluate_tickets, df_input, fake, checkpoint_dir)
+        assert fake.peak_in_flight == 2
+        assert len(fake.calls) == 6
+
+    def test_results_follow_input_order(self, tickets, checkpoint_dir):
+        # Las primeras filas tardan más, así que terminan las últimas
+        fake = FakeGroq(delays={f"ticket {i}": 0.05 * (5 - i) for i in range(5)})
+        df = run(main.evaluate_tickets, tickets, fake, checkpoint_dir)
+        assert df["content_explanation"].tolist() == [f"content ticket {i}" for i in range(5)]
+        assert df["content_score"].tolist() == [4] * 5
+
+    def test_api_error_marks_row_and_continues(self, tickets, checkpoint_dir):
+        fake = FakeGroq(fail_tickets={"ticket 2"})
+        df = run(main.evaluate_tickets, tickets, fake, checkpoint_dir)
+        assert df["content_score"].isna().tolist() == [False, False, True, False, False]
+        assert df.loc[2, "content_explanation"].startswith("Error:")
+        assert df.loc[3, "format_explanation"] == "format ticket 3"
+
+    def test_skipped_rows_do_not_call_api(self, checkpoint_dir):
+        fake = FakeGroq()
+        df_input = pd.DataFrame({"ticket": ["ok", "", "same"], "reply": ["reply", "reply", "same"]})
+        df = run(main.evaluate_tickets, df_input, fake, checkpoint_dir)
+        assert fake.calls == ["ok"]
+        assert df["content_explanation"].tolist() == [
+            "content ok", "Missing data", "Reply identical to ticket",
+        ]
+
+
+# ── Tests del checkpoint ──────────────────────────────────────────────────────
+
+class TestCheckpoint:
+
+    def test_flushes_a_fragment_every_chunk(self, tickets, checkpoint_dir, monkeypatch):
+        monkeypatch.setattr(main, "CHUNK", 2)
+        monkeypatch.setattr(main, "MAX_CONCURRENCY", 1)
+        run(main.evaluate_tickets, tickets, FakeGroq(), checkpoint_dir)
+        fragments = os.listdir(checkpoint_dir)
+        # 2 + 2 al alcanzar CHUNK y 1 en el volcado final
+        assert len(fragments) == 3
+        assert all(name.startswith("part-") and name.endswith(".parquet") for name in fragments)
+        assert checkpoint_rows(checkpoint_dir) == 5
+
+    def test_slow_row_does_not_hold_back_the_pool(self, checkpoint_dir, monkeypatch):
+        monkeypatch.setattr(main, "CHUNK", 2)
+        monkeypatch.setattr(main, "MAX_CONCURRENCY", 3)
+        df_input = pd.DataFrame({"ticket": [f"t{i}" for i in range(8)], "reply": ["r"] * 8})
+        fake = FakeGroq(delays={"t0": 0.3})
+        run(main.evaluate_tickets, df_input, fake, checkpoint_dir)
+        assert fake.completed[-1] == "t0"
+        assert checkpoint_rows(checkpoint_dir) == 8
+
+    def test_resumes_from_checkpoint(self, tickets, checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+        main._write_checkpoint_part(
+            checkpoint_dir, [checkpoint_record(f"ticket {i}", f"reply {i}") for i in (0, 3)],
+        )
+        fake = FakeGroq()
+        df = run(main.evaluate_tickets, tickets, fake, checkpoint_dir)
+        assert sorted(fake.calls) == ["ticket 1", "ticket 2", "ticket 4"]
+        assert df["content_explanation"].tolist() == [f"content ticket {i}" for i in range(5)]
+
+    def test_unreadable_fragment_is_skipped(self, tickets, checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+        main._write_checkpoint_part(checkpoint_dir, [checkpoint_record("ticket 0", "reply 0")])
+        with open(os.path.join(checkpoint_dir, "part-truncated.parquet"), "wb") as f:
+            f.write(b"PAR1 sin footer")
+        fake = FakeGroq()
+        df = run(main.evaluate_tickets, tickets, fake, checkpoint_dir)
+        assert sorted(fake.calls) == [f"ticket {i}" for i in range(1, 5)]
+        assert df["content_score"].notna().all()
+
+    def test_config_change_invalidates_checkpoint(self, tickets, checkpoint_dir, monkeypatch):
+        os.makedirs(checkpoint_dir)
+        main._write_checkpoint_part(
+            checkpoint_dir, [checkpoint_record(f"ticket {i}", f"reply {i}") for i in range(5)],
+        )
+        monkeypatch.setattr(main, "SYSTEM_PROMPT", main.SYSTEM_PROMPT + " Be strict.")
+        fake = FakeGroq()
+        run(main.evaluate_tickets, tickets, fake, checkpoint_dir)
+        assert sorted(fake.calls) == [f"ticket {i}" for i in range(5)]
+
+    def test_fragment_without_key_column_is_skipped(self, tickets, checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+        # Formato anterior, con ticket y reply en lugar de la clave
+        old_record = {"ticket": "ticket 0", "reply": "reply 0", **evaluation_for("ticket 0")}
+        pd.DataFrame([old_record]).to_parquet(os.path.join(checkpoint_dir, "part-old.parquet"))
+        fake = FakeGroq()
+        run(main.evaluate_tickets, tickets, fake, checkpoint_dir)
+        assert len(fake.calls) == 5
+
+
+# ── Tests de la Batch API ─────────────────────────────────────────────────────
+
+class FakeBatchApi:
+    """Simula los endpoints de archivos y batches de Groq."""
+
+    BATCH = {
+        "id": "batch_test", "object": "batch", "endpoint": "/v1/chat/completions",
+        "input_file_id": "file_in", "completion_window": "24h", "created_at": 0,
+    }
+
+    def __init__(self, output_lines=None, error_lines=None, status="completed"):
+        self.files = {
+            file_id: lines
+            for file_id, lines in (("file_out", output_lines), ("file_err", error_lines))
+            if lines is not None
+        }
+        self.status = status
+        self.uploaded = None
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/openai/v1/files" and request.method == "POST":
+            self.uploaded = request.content
+            return httpx.Response(200, json={
+                "id": "file_in", "object": "file", "bytes": len(request.content),
+                "created_at": 0, "filename": "tickets_batch.jsonl", "purpose": "batch",
+            })
+        if path == "/openai/v1/batches" and request.method == "POST":
+            return httpx.Response(200, json={**self.BATCH, "status": "validating"})
+        if path == "/openai/v1/batches/batch_test":
+            return httpx.Response(200, json={
+                **self.BATCH, "status": self.status,
+                "output_file_id": "file_out" if "file_out" in self.files else None,
+                "error_file_id":  "file_err" if "file_err" in self.files else None,
+            })
+        for file_id, lines in self.files.items():
+            if path == f"/openai/v1/files/{file_id}/content":
+                return httpx.Response(200, text="\n".join(json.dumps(line) for line in lines))
+        return httpx.Response(404, json={"error": {"message": f"unexpected {path}"}})
+
+
+class TestEvaluateTicketsBatch:
+
+    def test_joins_output_and_error_files(self, tickets, monkeypatch):
+        monkeypatch.setattr(main, "BATCH_POLL_SECONDS", 0)
+        fake = FakeBatchApi(
+            output_lines=[{
+                "custom_id": "0",
+                "response": {"status_code": 200, "body": {"choices": [
+                    {"message": {"content": json.dumps(evaluation_for("ticket 0"))}},
+                ]}},
+                "error": None,
+            }],
+            error_lines=[
+                {"custom_id": "1", "response": {
+                    "status_code": 400, "body": {"error": {"message": "context too long"}},
+                }, "error": None},
+                {"custom_id": "2", "response": None, "error": {"message": "expired"}},
+            ],
+        )
+        df = run(main.evaluate_tickets_batch, tickets, fake)
+
+        # El JSONL viaja dentro de un multipart: una línea con custom_id por fila
+        assert fake.uploaded.count(b'"custom_id"') == 5
+        assert df.loc[0, "content_explanation"] == "content ticket 0"
+        assert df.loc[1, "content_explanation"] == "Error: context too long"
+        assert df.loc[2, "content_explanation"] == "Error: expired"
+        assert df.loc[3, "content_explanation"].startswith("Error: sin respuesta")
+        assert df["content_score"].notna().tolist() == [True, False, False, False, False]
+
+    def test_raises_without_output_or_error_file(self, tickets, monkeypatch):
+        monkeypatch.setattr(main, "BATCH_POLL_SECONDS", 0)
+        with pytest.raises(RuntimeError, match="sin resultados"):
+            run(main.evaluate_tickets_batch, tickets, FakeBatchApi(status="failed"))
+
+
+# ── Tests de la caché ─────────────────────────────────────────────────────────
+
+class TestCache:
+
+    def test_cached_pair_skips_api(self, tickets, checkpoint_dir, isolated_cache):
+        fake = FakeGroq()
+        run(main.evaluate_tickets, tickets, fake, checkpoint_dir)
+        assert isolated_cache.get(main.cache_key("ticket 0", "reply 0")) == evaluation_for("ticket 0")
+
+        fake = FakeGroq()
+        df = run(main.evaluate_tickets, tickets, fake, checkpoint_dir + "_rerun")
+        assert fake.calls == []
+        assert df["content_score"].tolist() == [4] * 5
+
+    def test_duplicate_pairs_call_api_once(self, checkpoint_dir):
+        df_input = pd.DataFrame({"ticket": ["q", "other", " q "], "reply": ["r", "r", "r"]})
+        fake = FakeGroq(delays={"q": 0.02})
+        df = run(main.evaluate_tickets, df_input, fake, checkpoint_dir)
+        assert sorted(fake.calls) == ["other", "q"]
+        assert df["content_explanation"].tolist() == ["content q", "content other", "content q"]
+
+    def test_duplicate_pair_errors_fan_out(self, checkpoint_dir):
+        df_input = pd.DataFrame({"ticket": ["q", "q"], "reply": ["r", "r"]})
+        fake = FakeGroq(fail_tickets={"q"})
+        df = run(main.evaluate_tickets, df_input, fake, checkpoint_dir)
+        assert fake.calls == ["q"]
+        assert df["content_score"].isna().all()
+
+    def test_duplicate_pairs_share_one_batch_line(self, monkeypatch):
+        monkeypatch.setattr(main, "BATCH_POLL_SECONDS", 0)
+        ok = json.dumps(evaluation_for("q"))
+        fake = FakeBatchApi(output_lines=[{
+            "custom_id": "0",
+            "response": {"status_code": 200, "body": {"choices": [{"message": {"content": ok}}]}},
+            "error": None,
+        }])
+        df_input = pd.DataFrame({"ticket": ["q", "q"], "reply": ["r", "r"]})
+        df = run(main.evaluate_tickets_batch, df_input, fake)
+        assert fake.uploaded.count(b'"custom_id"') == 1
+        assert df["content_explanation"].tolist() == ["content q", "content q"]
+
+
+# ── Tests de reintentos ───────────────────────────────────────────────────────
+
+class TestRetries:
+
+    def failing(self, failures: int, status: int = 429):
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(request)
+            if len(calls) <= failures:
+                return httpx.Response(
+                    status, headers={"retry-after": "0"}, json={"error": {"message": "failed"}},
+                )
+            return completion_response(json.dumps(evaluation_for("t")))
+
+        return handler, calls
+
+    def evaluate_one(self, handler, checkpoint_dir):
+        return run(
+            main.evaluate_tickets, pd.DataFrame({"ticket": ["t"], "reply": ["r"]}),
+            handler, checkpoint_dir,
+        )
+
+    def test_rate_limited_request_is_retried(self, checkpoint_dir):
+        handler, calls = self.failing(failures=main.MAX_RETRIES - 1)
+        df = self.evaluate_one(handler, checkpoint_dir)
+        assert len(calls) == main.MAX_RETRIES
+        assert df.loc[0, "content_score"] == 4
+
+    def test_gives_up_after_max_retries(self, checkpoint_dir):
+        handler, calls = self.failing(failures=10)
+        df = self.evaluate_one(handler, checkpoint_dir)
+        # Sin reintentos internos del SDK: un intento HTTP por intento de tenacity
+        assert len(calls) == main.MAX_RETRIES
+        assert pd.isna(df.loc[0, "content_score"])
+
+    def test_server_error_is_retried(self, checkpoint_dir):
+        handler, calls = self.failing(failures=1, status=503)
+        df = self.evaluate_one(handler, checkpoint_dir)
+        assert len(calls) == 2
+        assert df.loc[0, "content_score"] == 4
+
+    def test_client_error_is_not_retried(self, checkpoint_dir):
+        handler, calls = self.failing(failures=1, status=400)
+        df = self.evaluate_one(handler, checkpoint_dir)
+        assert len(calls) == 1
+        assert pd.isna(df.loc[0, "content_score"])
+
+    def test_completions_client_has_no_sdk_retries(self):
+        async def _run():
+            async with main.groq_session(transport=httpx.MockTransport(FakeGroq())) as session:
+                return session.client.max_retries, session.completions.max_retries
+        assert asyncio.run(_run()) == (main.API_MAX_RETRIES, 0)
+
+
+# ── Tests de los workers ──────────────────────────────────────────────────────
+
+class TestEvaluateTicketsParallel:
+
+    def test_resumes_single_process_checkpoint(self, tickets, checkpoint_dir, tmp_path, monkeypatch):
+        # Todo está en el checkpoint, así que los workers no llaman a la API
+        os.makedirs(checkpoint_dir)
+        main._write_checkpoint_part(
+            checkpoint_dir, [checkpoint_record(f"ticket {i}", f"reply {i}") for i in range(5)],
+        )
+        output_dir = tmp_path / "output"
+        output_dir.mkdir()
+        monkeypatch.setattr(main, "OUTPUT_FILE", str(output_dir / "tickets_evaluated.parquet"))
+
+        df = main.evaluate_tickets_parallel(tickets, 2, checkpoint_dir)
+
+        assert df["content_explanation"].tolist() == [f"content ticket {i}" for i in range(5)]
+        assert os.listdir(output_dir) == []
+
+
+# ── Tests de la sesión HTTP compartida ────────────────────────────────────────
+
+class TestGroqSession:
+
+    def test_clients_share_one_http_client_closed_on_exit(self):
+        async def _run():
+            async with main.groq_session(transport=httpx.MockTransport(FakeGroq())) as session:
+                http_client = session.client._client
+                assert session.completions._client is http_client
+                assert not http_client.is_closed
+            return http_client
+        assert asyncio.run(_run()).is_closed
+
+    def test_run_evaluation_passes_rpm_to_the_limiter(self, tickets):
+        async def evaluate(session, df, marker):
+            return session.limiter.max_rate, len(df), marker
+        assert asyncio.run(main.run_evaluation(evaluate, tickets, "x", rpm=12)) == (12, 5, "x")
+
+
+# ── Tests de argumentos de línea de comandos ──────────────────────────────────
+
+class TestParseArgs:
+
+    def test_input_defaults_to_the_csv(self):
+        args = main.parse_args([])
+        assert args.input == main.INPUT_FILE
+        assert args.workers == 1
+
+    def test_input_accepts_a_parquet_path(self):
+        assert main.parse_args(["--input", "data/tickets.parquet"]).input == "data/tickets.parquet"
+
+    def test_rejects_batch_with_workers(self):
+        with pytest.raises(SystemExit):
+            main.parse_args(["--batch", "--workers", "2"])
+
+    def test_rejects_zero_workers(self):
+        with pytest.raises(SystemExit):
+            main.parse_args(["--workers", "0"])